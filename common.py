@@ -1,5 +1,5 @@
 import random
-from argparse import Namespace
+from argparse import ArgumentTypeError, Namespace
 from typing import List, Tuple, Union
 
 import PIL
@@ -17,12 +17,14 @@ from sklearn.utils.multiclass import unique_labels
 from torch import Tensor
 
 
-def fix_seed(seed: int = 0) -> None:
+def fix_seed(seed: int = 0, cudnn_benchmark: bool = False) -> None:
+    # cudnn benchmark picks the fastest algorithms for fixed input size,
+    # but they may be non deterministic, so results are not reproducible with it
     random.seed(seed)
     np.random.seed(seed)
     torch.manual_seed(seed)
-    torch.backends.cudnn.deterministic = True
-    torch.backends.cudnn.benchmark = False
+    torch.backends.cudnn.deterministic = not cudnn_benchmark
+    torch.backends.cudnn.benchmark = cudnn_benchmark
 
 
 def beutify_args(args: Namespace) -> str:
@@ -33,20 +35,36 @@ def beutify_args(args: Namespace) -> str:
     return text
 
 
+def str2bool(value: str) -> bool:
+    # argparse with type=bool treats any non empty string (even 'False') as True
+    if value.lower() in ('yes', 'true', 't', '1'):
+        return True
+    elif value.lower() in ('no', 'false', 'f', '0'):
+        return False
+    else:
+        raise ArgumentTypeError(f'Boolean value expected, got: {value}')
+
+
 class OnlineAvg:
-    avg: Union[np.ndarray, Tensor, float]
+    # keeps only the sum of values, so tensors are accumulated on their own device
+    # and division (with sync for gpu tensors) happens only when avg is requested
     n: int
+    _total: Union[np.ndarray, Tensor, float]
 
     def __init__(self):
-        self.avg = 0
+        self._total = 0
         self.n = 0
 
     def update(self, new_x: Union[np.ndarray, Tensor, float]) -> None:
+        self._total = self._total + new_x
         self.n += 1
-        self.avg = (self.avg * (self.n - 1) + new_x) / self.n
+
+    @property
+    def avg(self) -> Union[np.ndarray, Tensor, float]:
+        return self._total / self.n if self.n > 0 else 0
 
     def refresh(self) -> None:
-        self.avg = 0
+        self._total = 0
         self.n = 0
 
 
@@ -109,7 +127,7 @@ def put_text_to_image(image: np.ndarray,
 def canvas_to_img(canvas: FigureCanvas) -> PIL.Image:
     canvas.draw()
     string, (width, height) = canvas.print_to_buffer()
-    img = np.fromstring(string, np.uint8).reshape((height, width, 4))
+    img = np.frombuffer(string, np.uint8).reshape((height, width, 4))
     pil_image = PIL.Image.fromarray(img, mode='RGBA')
     return pil_image
 
@@ -1,7 +1,7 @@
 import logging
 import resource
 from pathlib import Path
-from typing import Tuple, List
+from typing import Tuple, List, Union
 
 import PIL
 import numpy as np
@@ -26,20 +26,20 @@ logger = logging.getLogger(__name__)
 class ImagesDataset(Dataset):
     _data_root: Path
     _im_paths: List[Path]
-    _labels_enum: List[int]
+    _labels_enum: np.ndarray
     _transforms: t.Compose
 
     def __init__(self,
                  data_root: Path,
                  im_paths: List[Path],
-                 labels_enum: List[int]
+                 labels_enum: Union[List[int], np.ndarray]
                  ):
         assert len(im_paths) == len(labels_enum)
 
         super().__init__()
         self._data_root = data_root
         self._im_paths = im_paths
-        self._labels_enum = labels_enum
+        self._labels_enum = np.asarray(labels_enum, dtype=np.int64)
         self._transforms = None
 
         logger.info(f'Dataset created with size {len(self)}')
@@ -49,7 +49,7 @@ class ImagesDataset(Dataset):
         assert self._transforms is not None
 
         im_tensor = self._transforms(self._read_pil(idx))
-        label = self._labels_enum[idx]
+        label = int(self._labels_enum[idx])
         return im_tensor, label
 
     def __len__(self) -> int:
@@ -71,7 +71,7 @@ class ImagesDataset(Dataset):
         self._transforms = get_test_transf(n_augs, aug_degree)
 
     @property
-    def labels_enum(self) -> List[int]:
+    def labels_enum(self) -> np.ndarray:
         return self._labels_enum
 
     # VISUALISATION
@@ -93,7 +93,7 @@ class ImagesDataset(Dataset):
                            color: Tuple[int, int, int]
                            ) -> Tensor:
         layout = torch.zeros([n_samples, 3, SIZE[0], SIZE[1]], dtype=torch.uint8)
-        ii_class = np.nonzero(np.array(self._labels_enum) == class_num)[0]
+        ii_class = np.nonzero(self._labels_enum == class_num)[0]
         ii_sampels = np.random.choice(ii_class, size=n_samples)
         for i, ind in enumerate(ii_sampels):
             layout[i, :, :, :] = self.get_signed_image(idx=ind, color=color, text=text)
@@ -133,10 +133,14 @@ def get_train_transf(aug_degree: float) -> t.Compose:
 
 def get_test_transf(n_tta: int, aug_degree: float) -> t.Compose:
     # Test Time Augmentation (TTA) aproach
+    # transforms are built once here, not for every image in the workers
+    rand_transf = get_rand_transf(aug_degree)
+    resize_transf = t.Resize(size=SIZE)
+    default_transf = get_default_transf()
     transforms = t.Compose([
-        t.Lambda(lambda image: [get_rand_transf(aug_degree)(image) for _ in range(n_tta)]),
-        t.Lambda(lambda images: [t.Resize(size=SIZE)(image) for image in images]),
-        t.Lambda(lambda images: [get_default_transf()(image) for image in images])
+        t.Lambda(lambda image: [rand_transf(image) for _ in range(n_tta)]),
+        t.Lambda(lambda images: [resize_transf(image) for image in images]),
+        t.Lambda(lambda images: [default_transf(image) for image in images])
     ])
     return transforms
 
@@ -154,7 +158,7 @@ def get_rand_transf(k: float) -> t.RandomOrder:
                        translate=(0.1 * k, 0.1 * k),
                        scale=(1 - 0.1 * k, 1 + 0.1 * k),
                        shear=k * 5,
-                       fillcolor=0
+                       fill=0
                        ),
         t.ColorJitter(brightness=0.1 * k,
                       contrast=0.1 * k,
@@ -4,7 +4,7 @@ from typing import Tuple, Set, List
 
 import torch
 
-from common import fix_seed
+from common import fix_seed, str2bool
 from hierarchical.hier_dataset import HierDataset
 from hierarchical.hier_network import Classifier
 from hierarchical.hier_structure import Hierarchy
@@ -83,7 +83,7 @@ def get_parser() -> ArgumentParser:
 
     parser.add_argument('--n_epoch', dest='n_epoch', type=int, default=100)
     parser.add_argument('--aug_degree', dest='aug_degree', type=float, default=2.5)
-    parser.add_argument('--splitted_heads', dest='splitted_heads', type=bool, default=True)
+    parser.add_argument('--splitted_heads', dest='splitted_heads', type=str2bool, default=True)
 
     parser.add_argument('--device', dest='device', type=torch.device, default='cuda:1')
     parser.add_argument('--random_seed', dest='random_seed', type=int, default=42)
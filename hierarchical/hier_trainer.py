@@ -6,11 +6,11 @@ from typing import Dict, DefaultDict
 
 import numpy as np
 import torch
-from tensorboardX import SummaryWriter
 from torch.nn import CrossEntropyLoss
 from torch.nn.functional import softmax
 from torch.optim.lr_scheduler import CosineAnnealingLR
 from torch.utils.data import DataLoader
+from torch.utils.tensorboard import SummaryWriter
 from tqdm import tqdm
 
 from common import OnlineAvg
@@ -61,7 +61,7 @@ class Trainer:
         self._cross_entropy = CrossEntropyLoss()
         self._optimizer = torch.optim.SGD(classifier.parameters(), lr=1e-1)
 
-        self._writer = SummaryWriter(log_dir=board_dir)
+        self._writer = SummaryWriter(log_dir=str(board_dir))
         self._i_global = 0
 
         self._classifier.to(self._device)
@@ -129,7 +129,7 @@ class Trainer:
             logger.info(f'\nEpoch {i + 1} / {n_epoch}:')
 
             self.data_loop(Mode.TRAIN)
-            self._writer.add_scalar('lr', scheduler.get_lr()[0], self._i_global)
+            self._writer.add_scalar('lr', scheduler.get_last_lr()[0], self._i_global)
             scheduler.step()
 
             acc = self.data_loop(Mode.TEST)
@@ -2,7 +2,6 @@ import logging
 from pathlib import Path
 from typing import List, Tuple, Any, Union
 
-import numpy as np
 import torch
 import torch.nn as nn
 import torchvision.models as models
@@ -64,7 +63,7 @@ class Classifier(nn.Module):
                  inp: Union[Tensor, List[Tensor]]
                  ) -> Tuple[Tensor, Tensor]:
         self._model.eval()
-        with torch.no_grad():
+        with torch.inference_mode():
             if isinstance(inp, list):
                 probs = self._classify_tta(inputs=inp)
             else:
@@ -73,21 +72,19 @@ class Classifier(nn.Module):
         return label, confidence
 
     def _classify_tta(self, inputs: List[Tensor]) -> Tensor:
-        with torch.no_grad():
+        with torch.inference_mode():
             bs, n_tta = inputs[0].shape[0], len(inputs)
             input_tensor = torch.cat(inputs)
             logits = self._model(input_tensor)
 
-            # now calc averaged by augmentations logit for each sample in batch
-            probs_avg = torch.zeros([bs, self._n_classes], dtype=torch.float)
-            for i in range(bs):
-                ii = np.arange(start=i, stop=n_tta * bs, step=bs)
-                probs = softmax(logits[ii, :], dim=1)
-                probs_avg[i, :] = torch.mean(probs, dim=0)
+            # now calc averaged by augmentations logit for each sample in batch,
+            # rows of logits are ordered as [aug0: sample0..sampleN, aug1: sample0..sampleN, ...]
+            probs = softmax(logits, dim=1).view(n_tta, bs, -1)
+            probs_avg = torch.mean(probs, dim=0)
         return probs_avg
 
     def _classify_simple(self, inp: Tensor) -> Tensor:
-        with torch.no_grad():
+        with torch.inference_mode():
             logits = self._model(inp)
             probs = softmax(logits, dim=1)
         return probs
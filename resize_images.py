@@ -2,8 +2,9 @@ import argparse
 from argparse import ArgumentParser
 from pathlib import Path
 
+import numpy as np
+from PIL import Image
 from matplotlib import image as mpimg
-from scipy.misc import imresize
 from tqdm import tqdm
 
 
@@ -11,7 +12,7 @@ def resize_inplace(im_dir: Path, height: int, width: int) -> None:
     im_paths = list(im_dir.glob('**/*.jpg'))
     for im_path in tqdm(im_paths):
         image = mpimg.imread(im_path)
-        image_resized = imresize(arr=image, size=(height, width))
+        image_resized = np.array(Image.fromarray(image).resize((width, height), Image.BILINEAR))
         mpimg.imsave(im_path, image_resized)
 
 
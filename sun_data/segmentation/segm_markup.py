@@ -51,7 +51,7 @@ def xml_to_mask(xml_content: str,
 
         labels.append(obj['name'])
 
-    masks_stacked = np.stack(masks).astype(np.bool)
+    masks_stacked = np.stack(masks).astype(bool)
     masks_stacked = np.transpose(masks_stacked, (1, 2, 0))
 
     return masks_stacked, labels, folder
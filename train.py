@@ -5,9 +5,10 @@ from datetime import datetime
 from pathlib import Path
 from typing import Tuple
 
+import numpy as np
 import torch
 
-from common import beutify_args, Stopper, fix_seed
+from common import beutify_args, Stopper, fix_seed, str2bool
 from dataset import ImagesDataset
 from network import Classifier
 from sun_data.utils import DataMode, load_data
@@ -21,13 +22,15 @@ def main(args: Namespace) -> float:
     board_dir, ckpt_dir = setup_logging(args.log_dir)
     logger.info(f'Params: \n{beutify_args(args)}')
 
-    fix_seed(args.seed)
+    fix_seed(args.seed, cudnn_benchmark=args.cudnn_benchmark)
 
     (train_paths, train_names), (test_paths, test_names), name_to_enum = \
         load_data(args.data_mode)
 
-    train_labels = [name_to_enum[name] for name in train_names]
-    test_labels = [name_to_enum[name] for name in test_names]
+    train_labels = np.fromiter((name_to_enum[name] for name in train_names),
+                               dtype=np.int64, count=len(train_names))
+    test_labels = np.fromiter((name_to_enum[name] for name in test_names),
+                              dtype=np.int64, count=len(test_names))
 
     train_set = ImagesDataset(args.data_root, train_paths, train_labels)
     test_set = ImagesDataset(args.data_root, test_paths, test_labels)
@@ -43,7 +46,8 @@ def main(args: Namespace) -> float:
                       name_to_enum=name_to_enum, device=args.device,
                       batch_size=args.batch_size, n_workers=args.n_workers,
                       aug_degree=args.aug_degree, init_lr=args.init_lr,
-                      optimizer=args.optimizer, visualize=args.visualize)
+                      optimizer=args.optimizer, visualize=args.visualize,
+                      compile_model=args.compile)
 
     max_metric = trainer.train(n_max_epoch=args.n_max_epoch, test_freq=args.test_freq,
                                n_tta=args.n_tta, stopper=stopper, use_cosine_lr=args.use_cosine_lr,
@@ -74,19 +78,26 @@ def get_parser() -> ArgumentParser:
     parser.add_argument('--data_mode', dest='data_mode', type=DataMode,
                         default=DataMode.CLASSIC_01, help=f'One mode from {DataMode}.')
 
-    parser.add_argument('--visualize', dest='visualize', type=bool, default=False)
+    parser.add_argument('--visualize', dest='visualize', type=str2bool, default=False)
     parser.add_argument('--arch', dest='arch', type=str, default='resnet18')
-    parser.add_argument('--pretrained', dest='pretrained', type=bool, default=True)
+    parser.add_argument('--compile', dest='compile', type=str2bool, default=False,
+                        help='Compile classifier with torch.compile for faster training. '
+                             'It needs working Inductor toolchain (triton, C++ compiler), '
+                             'otherwise training crashes on the first step.')
+    parser.add_argument('--pretrained', dest='pretrained', type=str2bool, default=True)
     parser.add_argument('--optimizer', dest='optimizer', type=str, default='SGD')
     parser.add_argument('--init_lr', dest='init_lr', type=float, default=1e-1)
-    parser.add_argument('--use_cosine_lr', dest='use_cosine_lr', type=bool, default=True)
+    parser.add_argument('--use_cosine_lr', dest='use_cosine_lr', type=str2bool, default=True)
     parser.add_argument('--n_max_epoch', dest='n_max_epoch', type=int, default=50)
     parser.add_argument('--test_freq', dest='test_freq', type=int, default=1)
     parser.add_argument('--batch_size', dest='batch_size', type=int, default=256)
     parser.add_argument('--n_tta', dest='n_tta', type=int, default=8)
-    parser.add_argument('--n_workers', dest='n_workers', type=int, default=4)
+    parser.add_argument('--n_workers', dest='n_workers', type=int, default=4,
+                        help='Number of data loading workers, more than 8 usually just wastes memory.')
     parser.add_argument('--device', dest='device', type=torch.device, default='cuda:3')
     parser.add_argument('--random_seed', dest='seed', type=int, default=42)
+    parser.add_argument('--cudnn_benchmark', dest='cudnn_benchmark', type=str2bool, default=False,
+                        help='Faster convolutions, but training becomes non reproducible.')
     parser.add_argument('--aug_degree', dest='aug_degree', type=float, default=2,
                         help='0 - turn off augmentations,'
                              '1 - for medium augmentations,'
@@ -1,29 +1,33 @@
 import logging
+from copy import copy
 from enum import Enum
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List
 
 import numpy as np
 import torch
 import torchvision.transforms as t
 from bidict import bidict
-from tensorboardX import SummaryWriter
-from torch import nn, optim
+from torch import nn, optim, Tensor
+from torch.amp import GradScaler, autocast
 from torch.nn.functional import softmax
 from torch.optim import Optimizer
 from torch.optim.lr_scheduler import CosineAnnealingLR
 from torch.utils.data import DataLoader
+from torch.utils.tensorboard import SummaryWriter
 from torchvision import utils as vutils
 from tqdm import tqdm
 
 from common import OnlineAvg, Stopper, confusion_matrix_as_img, histogram_as_img
-from dataset import ImagesDataset, SIZE
+from dataset import ImagesDataset
 from metrics import Calculator
 from network import Classifier, Arch
 from sun_data.utils import beutify_name
 
 logger = logging.getLogger(__name__)
 
+LOSS_LOG_FREQ = 50  # loss is written to board only once per this number of steps
+
 
 class Mode(Enum):
     TRAIN = 'train'
@@ -32,6 +36,7 @@ class Mode(Enum):
 
 class Trainer:
     _classifier: Classifier
+    _compiled_classifier: nn.Module
     _board_dir: Path
     _train_set: ImagesDataset
     _test_set: ImagesDataset
@@ -39,13 +44,19 @@ class Trainer:
     _device: torch.device
     _batch_size: int
     _num_workers: int
+    _pin_memory: bool
     _aug_degree: float
 
     _criterion: nn.Module
     _optimizer: Optimizer
+    _use_amp: bool
+    _scaler: GradScaler
     _writer: SummaryWriter
     _visualize: bool
 
+    _train_loader: DataLoader
+    _test_loader: DataLoader
+
     def __init__(self,
                  classifier: Classifier,
                  board_dir: Path,
@@ -58,7 +69,8 @@ class Trainer:
                  aug_degree: float,
                  optimizer: str,
                  init_lr: float,
-                 visualize: bool
+                 visualize: bool,
+                 compile_model: bool
                  ):
 
         self._classifier = classifier
@@ -69,6 +81,7 @@ class Trainer:
         self._device = device
         self._batch_size = batch_size
         self._num_workers = n_workers
+        self._pin_memory = self._device.type == 'cuda'
         self._aug_degree = aug_degree
 
         self._criterion = nn.CrossEntropyLoss()
@@ -80,103 +93,132 @@ class Trainer:
         else:
             raise ValueError(f'Unexpected optimizer: {optimizer}')
 
+        # mixed precision makes sense only on gpu, on cpu scaler and autocast are no-op
+        self._use_amp = self._device.type == 'cuda'
+        self._scaler = GradScaler('cuda', enabled=self._use_amp)
+
         self._i_global = 0
-        self._classifier.to(self._device)
+        # channels last (NHWC) layout allows cudnn to use tensor cores without extra transposes
+        self._classifier.to(self._device, memory_format=torch.channels_last)
+
+        # compiled module shares parameters with the original one, so checkpoints
+        # are still saved from the plain classifier (without compile-prefixed keys)
+        self._compiled_classifier = self._classifier
+        if compile_model:
+            logger.info('Classifier will be compiled with torch.compile on the first train step.')
+            self._compiled_classifier = torch.compile(self._classifier, mode='default', dynamic=False)
+
         self._writer = SummaryWriter(str(self._board_dir))
         self._visualize = visualize
 
-    def train_epoch(self) -> float:
-        self._classifier.train()
+        # loaders are created once, so their persistent workers live across epochs;
+        # workers keep their own copy of dataset, so transforms must be set before loader creation
         if self._aug_degree > 0:
             self._train_set.set_train_transforms(aug_degree=self._aug_degree)
         else:
             self._train_set.set_default_transforms()
 
-        loader = DataLoader(dataset=self._train_set,
-                            batch_size=self._batch_size,
-                            num_workers=self._num_workers,
-                            shuffle=True, drop_last=True
-                            )
+        self._train_loader = DataLoader(dataset=self._train_set,
+                                        batch_size=self._batch_size,
+                                        shuffle=True, drop_last=True,
+                                        **self._get_loader_args()
+                                        )
 
-        avg_loss = OnlineAvg()
-        loader_tqdm = tqdm(loader, total=len(loader))
+        self._test_set.set_default_transforms()
+        self._test_loader = DataLoader(dataset=self._test_set, batch_size=self._batch_size,
+                                       shuffle=False, drop_last=False, **self._get_loader_args())
+
+    def train_epoch(self) -> float:
+        self._classifier.train()
 
-        gts: List[int] = []
-        preds: List[int] = []
-        probs: List[float] = []
+        avg_loss = OnlineAvg()
+        loader_tqdm = tqdm(self._train_loader, total=len(self._train_loader))
+
+        # batch results are collected as arrays and concatenated once after the loop,
+        # predicts and losses stay on device until the end of epoch to avoid sync on every step
+        gts: List[np.ndarray] = []
+        preds: List[Tensor] = []
+        probs: List[Tensor] = []
+        step_losses: List[Tensor] = []
+        step_ids: List[int] = []
         for im, label in loader_tqdm:
-            self._optimizer.zero_grad()
+            self._optimizer.zero_grad(set_to_none=True)
 
-            if self._classifier.arch == Arch.INCEPTION3:
-                logits, aux_output = self._classifier(im.to(self._device))
-                loss1 = self._criterion(logits, label.to(self._device))
-                loss2 = self._criterion(aux_output, label.to(self._device))
-                loss = loss1 + .4 * loss2
+            im = im.to(self._device, non_blocking=True, memory_format=torch.channels_last)
+            label_device = label.to(self._device, non_blocking=True)
 
-            else:
-                logits = self._classifier(im.to(self._device))
-                loss = self._criterion(logits, label.to(self._device))
+            with autocast('cuda', enabled=self._use_amp):
+                if self._classifier.arch == Arch.INCEPTION3:
+                    logits, aux_output = self._compiled_classifier(im)
+                    loss1 = self._criterion(logits, label_device)
+                    loss2 = self._criterion(aux_output, label_device)
+                    loss = loss1 + .4 * loss2
 
-            loss_data = loss.detach().cpu().numpy()
-            self._writer.add_scalar('Loss', loss_data, self._i_global)
+                else:
+                    logits = self._compiled_classifier(im)
+                    loss = self._criterion(logits, label_device)
 
-            loss.backward()
-            self._optimizer.step()
+            self._scaler.scale(loss).backward()
+            self._scaler.step(self._optimizer)
+            self._scaler.update()
 
             max_logits, ii_max = logits.max(dim=1)
-            prob = softmax(max_logits, dim=0).detach().cpu().numpy().tolist()
-            pred = ii_max.detach().cpu().numpy().tolist()
+            prob = softmax(max_logits.float(), dim=0).detach()
+            pred = ii_max.detach()
 
-            gts.extend(label)
-            preds.extend(pred)
-            probs.extend(prob)
+            gts.append(label.numpy())
+            preds.append(pred)
+            probs.append(prob)
 
-            avg_loss.update(loss_data)
-            loader_tqdm.set_postfix({'Avg loss': round(float(avg_loss.avg), 4)})
-            self._writer.add_scalar('Loss', loss_data, self._i_global)
+            avg_loss.update(loss.detach())
+            if self._i_global % LOSS_LOG_FREQ == 0:
+                step_losses.append(loss.detach())
+                step_ids.append(self._i_global)
             self._i_global += 1
 
+        logger.info(f'Avg loss: {round(float(avg_loss.avg), 4)}')
+        if step_losses:
+            for loss_data, i_step in zip(torch.stack(step_losses).tolist(), step_ids):
+                self._writer.add_scalar('Loss', loss_data, i_step)
+
+        gts = np.concatenate(gts)
+        preds, probs = torch.cat(preds).cpu().numpy(), torch.cat(probs).cpu().numpy()
         main_metric = self._log_metrics(gts, preds, probs, Mode.TRAIN)
         return main_metric
 
     def test(self, n_tta: int) -> float:
-        if n_tta != 0:
-            self._test_set.set_test_transforms(n_augs=n_tta, aug_degree=self._aug_degree)
-            batch_size_tta = int(self._batch_size / n_tta)
-
-        else:
-            batch_size_tta = self._batch_size
-            self._test_set.set_default_transforms()
-
-        loader = DataLoader(dataset=self._test_set, batch_size=batch_size_tta,
-                            num_workers=self._num_workers, shuffle=False, drop_last=False)
-
-        gts: List[int] = []
-        preds: List[int] = []
-        probs: List[float] = []
-        with torch.no_grad():
+        loader = self._test_loader if n_tta == 0 else self._get_tta_loader(n_tta)
+        batch_size_tta = loader.batch_size
+
+        # results are written to buffers on device and copied back to cpu only once after the loop
+        n_samples = len(self._test_set)
+        gts = torch.empty(n_samples, dtype=torch.long, device=self._device)
+        preds = torch.empty(n_samples, dtype=torch.long, device=self._device)
+        probs = torch.empty(n_samples, dtype=torch.float32, device=self._device)
+        with torch.inference_mode():
             for i, (im, label) in tqdm(enumerate(loader), total=len(loader)):
+                i_start = i * batch_size_tta
+                i_stop = i_start + len(label)
+
                 if n_tta != 0:
                     assert isinstance(im, List)
-                    im = [x.to(self._device) for x in im]
+                    im = [x.to(self._device, non_blocking=True, memory_format=torch.channels_last) for x in im]
                 else:
-                    im = im.to(self._device)
-
-                pred, prob = self._classifier.classify(im)
+                    im = im.to(self._device, non_blocking=True, memory_format=torch.channels_last)
 
-                pred = pred.detach().cpu().numpy().tolist()
-                prob = prob.detach().cpu().numpy().tolist()
+                with autocast('cuda', enabled=self._use_amp):
+                    pred, prob = self._classifier.classify(im)
 
-                gts.extend(label)
-                preds.extend(pred)
-                probs.extend(prob)
+                gts[i_start:i_stop] = label.to(self._device, non_blocking=True)
+                preds[i_start:i_stop] = pred
+                probs[i_start:i_stop] = prob
 
+        gts, preds, probs = gts.cpu().numpy(), preds.cpu().numpy(), probs.cpu().numpy()
         main_metric = self._log_metrics(gts, preds, probs, Mode.TEST)
 
-        gts, preds, probs = np.array(gts), np.array(preds), np.array(probs)
-        mc = Calculator(gts=gts, preds=preds, probs=probs)
-        ii_worst, ii_best = mc.worst_errors(n_worst=2), mc.best_preds(n_best=2)
         if self._visualize:
+            mc = Calculator(gts=gts, preds=preds, probs=probs)
+            ii_worst, ii_best = mc.worst_errors(n_worst=2), mc.best_preds(n_best=2)
             self._visualize_preds(ii_best, preds[ii_best], tag='predicts/correct', draw_samples=False)
             self._visualize_preds(ii_worst, preds[ii_worst], tag='predicts/errors', draw_samples=False)
         return main_metric
@@ -202,7 +244,7 @@ class Trainer:
 
             if use_cosine_lr:
                 scheduler.step()
-                lr = scheduler.get_lr()[0]
+                lr = scheduler.get_last_lr()[0]
                 self._writer.add_scalar(scalar_value=lr, global_step=self._i_global, tag='lr')
 
             # train
@@ -230,7 +272,7 @@ class Trainer:
 
         if n_tta > 0:
             self._classifier, _ = Classifier.from_ckpt(best_ckpt_path)
-            self._classifier.to(self._device)
+            self._classifier.to(self._device, memory_format=torch.channels_last)
             logger.info('Try improve this value with TTA:')
             acc_tta = self.test(n_tta=n_tta)
             logger.info(f'Metric value with TTA: {acc_tta}')
@@ -239,10 +281,26 @@ class Trainer:
         else:
             return acc_max
 
+    def _get_tta_loader(self, n_tta: int) -> DataLoader:
+        # shallow copy of test set shares data with the original one, but has its own transforms;
+        # TTA runs only once after training, so its workers are not kept alive
+        tta_set = copy(self._test_set)
+        tta_set.set_test_transforms(n_augs=n_tta, aug_degree=self._aug_degree)
+        loader = DataLoader(dataset=tta_set, batch_size=int(self._batch_size / n_tta),
+                            shuffle=False, drop_last=False,
+                            **{**self._get_loader_args(), 'persistent_workers': False})
+        return loader
+
+    def _get_loader_args(self) -> Dict[str, Any]:
+        args: Dict[str, Any] = {'num_workers': self._num_workers, 'pin_memory': self._pin_memory}
+        if self._num_workers > 0:
+            # workers are not respawned every epoch and keep a few batches ready in advance
+            args.update({'persistent_workers': True, 'prefetch_factor': 4})
+        return args
+
     # LOGGING
 
-    def _log_metrics(self, gts: List[int], preds: List[int], probs: List[float], mode: Mode) -> float:
-        gts, preds, probs = np.array(gts), np.array(preds), np.array(probs)
+    def _log_metrics(self, gts: np.ndarray, preds: np.ndarray, probs: np.ndarray, mode: Mode) -> float:
         if self._visualize:
             self._visualize_confusion(preds=preds, gts=gts, mode=mode)
 
@@ -266,14 +324,13 @@ class Trainer:
         assert len(ids) == len(enums_pred)
 
         dataset = self._test_set
-        dataset.set_default_transforms()
 
         base_color, gt_color, err_color = (0, 0, 0), (0, 255, 0), (255, 0, 0)
         n_gt_samples, n_pred_samples = 2, 2
 
-        layout_tensor = torch.zeros([0, 3, SIZE[0], SIZE[1]], dtype=torch.uint8)
+        layout: List[Tensor] = []
         for (idx, enum_pred) in zip(ids, enums_pred):
-            _, enum_gt = dataset[idx]
+            enum_gt = int(dataset.labels_enum[idx])
             name_gt = beutify_name(self._name_to_enum.inv[enum_gt])
             name_pred = beutify_name(self._name_to_enum.inv[enum_pred])
 
@@ -289,15 +346,14 @@ class Trainer:
                 pred_imgs = dataset.draw_class_samples(n_samples=n_pred_samples, class_num=enum_pred,
                                                        color=pred_color, text=[name_pred])
 
-                layout_tensor = torch.cat([
-                    layout_tensor, anchor_im.unsqueeze(dim=0), gt_imgs, pred_imgs
-                ], dim=0)
+                layout.extend([anchor_im.unsqueeze(dim=0), gt_imgs, pred_imgs])
 
             else:
                 anchor_im = dataset.get_signed_image(text=[f'pred: {name_pred}', f'gt: {name_gt}'],
                                                      idx=idx, color=gt_color)
-                layout_tensor = torch.cat([layout_tensor, anchor_im.unsqueeze(dim=0)], dim=0)
+                layout.append(anchor_im.unsqueeze(dim=0))
 
+        layout_tensor = torch.cat(layout, dim=0)
         n_row = n_gt_samples + n_pred_samples + 1 if draw_samples else 4
         grid = vutils.make_grid(tensor=layout_tensor, nrow=n_row, normalize=False, scale_each=False)
         self._writer.add_image(img_tensor=grid, global_step=self._i_global, tag=tag)
@@ -309,10 +365,8 @@ class Trainer:
                                img_tensor=t.ToTensor()(conf_mat))
 
     def _visualize_hist(self) -> None:
-        labels_enum = []
-        labels_enum.extend(self._train_set.labels_enum.copy())
-        labels_enum.extend(self._test_set.labels_enum.copy())
-        names = [self._name_to_enum.inv[enum] for enum in labels_enum]
+        labels_enum = np.concatenate([self._train_set.labels_enum, self._test_set.labels_enum])
+        names = [self._name_to_enum.inv[enum] for enum in labels_enum.tolist()]
         histogram = histogram_as_img(names)
         self._writer.add_image(global_step=self._i_global, tag='Histogram.',
                                img_tensor=t.ToTensor()(histogram))